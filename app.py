@@ -1,9 +1,25 @@
 import os
+import atexit
+import collections
+import concurrent.futures
+import hashlib
+import queue
+import secrets
 import sqlite3
+import threading
+import time
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g
+from functools import wraps
+from flask import (
+    Flask, render_template, request, redirect, url_for, session, flash, g, make_response,
+    Response, stream_template, get_flashed_messages, abort,
+)
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+from itsdangerous import BadSignature
+from markupsafe import Markup
+from werkzeug.datastructures import CallbackDict
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 
 # --- Config ---
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -16,41 +32,130 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev_secret_change_this")
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["DATABASE"] = DB_PATH
+# Static files are cache-busted by static_cache_buster(), so browsers can keep them.
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 60 * 60 * 24 * 30
+# Optional override, e.g. "pbkdf2:sha256:100000"; unset keeps werkzeug's default.
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD")
+# Bump when the DDL in init_db() changes; stored in PRAGMA user_version.
+SCHEMA_VERSION = 5
+REVIEWS_PER_PAGE = 50
 
 # ✅ Make datetime available in all templates
 @app.context_processor
 def inject_datetime():
     return {'datetime': datetime}
 
+# The logged-in user's row, looked up once per request (see get_user_by_id).
+@app.context_processor
+def inject_current_user():
+    user_id = session.get("user_id")
+    return {"current_user": get_user_by_id(user_id) if user_id is not None else None}
+
+# Version static URLs by mtime so the long max-age never serves stale assets.
+@app.url_defaults
+def static_cache_buster(endpoint, values):
+    if endpoint == "static" and "filename" in values:
+        try:
+            values["v"] = int(os.stat(os.path.join(app.static_folder, values["filename"])).st_mtime)
+        except OSError:
+            pass
+
 # --- DB helpers ---
+# Connections are reused across requests instead of reopened every time.
+# SQLite allows a single writer, so writes are serialized in-process too.
+_READ_POOL = queue.LifoQueue(maxsize=8)
+_WRITE_LOCK = threading.Lock()
+
+def _connect():
+    db = sqlite3.connect(
+        app.config["DATABASE"],
+        isolation_level=None,
+        check_same_thread=False,
+        # Above sqlite3's default of 128: load_user_emails() adds one statement
+        # per distinct IN-list length (up to a page of reviews).
+        cached_statements=256,
+    )
+    db.row_factory = sqlite3.Row
+    # Per-connection settings; journal_mode=WAL persists in the file itself.
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA busy_timeout=5000")
+    db.execute("PRAGMA temp_store=MEMORY")
+    db.execute("PRAGMA mmap_size=134217728")
+    db.execute("PRAGMA cache_size=-20000")
+    db.execute("PRAGMA foreign_keys=ON")
+    return db
+
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(app.config["DATABASE"])
-        db.row_factory = sqlite3.Row
+        try:
+            db = _READ_POOL.get_nowait()
+        except queue.Empty:
+            db = _connect()
+        g._database = db
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, "_database", None)
+    db = g.pop("_database", None)
     if db is not None:
-        db.close()
+        if db.in_transaction:
+            db.rollback()
+        try:
+            _READ_POOL.put_nowait(db)
+        except queue.Full:
+            db.close()
+
+def iter_rows(cur, size=200):
+    """Yield rows from cur in fetchmany() batches instead of one fetchall()."""
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+@atexit.register
+def close_pool():
+    while True:
+        try:
+            _READ_POOL.get_nowait().close()
+        except queue.Empty:
+            break
 
 def init_db():
-    """Create tables if they don't exist."""
-    conn = sqlite3.connect(app.config["DATABASE"])
-    c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS users (
+    """Create or upgrade the schema. Skipped once the schema is current."""
+    conn = sqlite3.connect(app.config["DATABASE"], isolation_level=None, timeout=5)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            return
+        # WAL lets readers and the writer work concurrently and needs fewer fsyncs.
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Table rebuilds in _migrate_schema() need foreign keys off on this
+        # connection; request connections turn them on in _connect().
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("BEGIN IMMEDIATE")
+        # Another worker may have finished while we waited for the write lock.
+        if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            conn.execute("COMMIT")
+            return
+        c = conn.cursor()
+        _migrate_schema(c)
+        _create_schema(c)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+# Column definitions per table, shared by creation and migration.
+_TABLES = {
+    "users": """
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT NOT NULL,
         email TEXT NOT NULL UNIQUE,
         password_hash TEXT NOT NULL,
-        created_at TEXT NOT NULL
-    );
-    """)
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS appointments (
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    """,
+    "appointments": """
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
         name TEXT NOT NULL,
@@ -58,40 +163,309 @@ def init_db():
         appt_date TEXT NOT NULL,
         appt_time TEXT NOT NULL,
         reason TEXT,
-        created_at TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY(user_id) REFERENCES users(id)
-    );
-    """)
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS reviews (
+    """,
+    "reviews": """
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
         name TEXT NOT NULL,
         rating INTEGER NOT NULL,
         comment TEXT,
-        created_at TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY(user_id) REFERENCES users(id)
+    """,
+}
+
+def _create_schema(c):
+    """Create missing tables and indexes.
+
+    Runs inside init_db()'s BEGIN IMMEDIATE transaction so all DDL commits
+    with a single fsync. executescript() is not used: it commits any open
+    transaction first, which would drop the user_version guard's write lock.
+    """
+    for table, columns in _TABLES.items():
+        c.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns});")
+    # users.email is UNIQUE, so SQLite already keeps an index for it.
+    # Keys match the listings' ORDER BY created_at DESC, id DESC exactly, so
+    # neither query needs a sort step.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reviews_recent ON reviews(created_at DESC, id DESC)")
+    # Also covers the /book listing so it is answered from the index alone.
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appt_user_recent"
+        " ON appointments(user_id, created_at DESC, id DESC, appt_date, appt_time, reason)"
+    )
+    # Server-side sessions (see SqliteSessionInterface); not in _TABLES as it
+    # has no created_at column to migrate.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
     );
     """)
-    conn.commit()
-    conn.close()
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+
+def _migrate_schema(c):
+    """Rebuild tables created before created_at defaulted to CURRENT_TIMESTAMP."""
+    for table, columns in _TABLES.items():
+        row = c.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if row is None or "DEFAULT CURRENT_TIMESTAMP" in row[0]:
+            continue
+        # SQLite can't change a column default in place; copy into a new table.
+        # Old rows hold datetime.isoformat() values; rewrite them in
+        # CURRENT_TIMESTAMP's "YYYY-MM-DD HH:MM:SS" form so they sort and
+        # display like new rows.
+        names = [info[1] for info in c.execute(f"PRAGMA table_info({table})")]
+        values = [
+            "replace(substr(created_at, 1, 19), 'T', ' ')" if name == "created_at" else name
+            for name in names
+        ]
+        c.execute(f"CREATE TABLE {table}_new ({columns});")
+        c.execute(
+            f"INSERT INTO {table}_new ({', '.join(names)}) SELECT {', '.join(values)} FROM {table}"
+        )
+        c.execute(f"DROP TABLE {table}")
+        c.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    # Superseded by idx_reviews_recent and idx_appt_user_recent.
+    c.execute("DROP INDEX IF EXISTS idx_reviews_created")
+    c.execute("DROP INDEX IF EXISTS idx_appt_user_created")
+    c.execute("DROP INDEX IF EXISTS idx_appt_user_covering")
+
+# Initialize DB on import (safe small operation). Under `python app.py` the
+# reloader parent only spawns the serving child, so leave the work to it.
+if not (__name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") is None):
+    init_db()
+
+# --- Queries ---
+# All SQL lives here so queries are easy to find and reuse in one place.
+# Only the login/register path reads password_hash.
+_SELECT_USER_BY_EMAIL_SQL = "SELECT id, name, email, password_hash FROM users WHERE email = ?"
+_SELECT_USER_BY_ID_SQL = "SELECT id, name, email, created_at FROM users WHERE id = ?"
+_INSERT_USER_SQL = "INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)"
+_INSERT_APPT_SQL = "INSERT INTO appointments (user_id, name, email, appt_date, appt_time, reason) VALUES (?, ?, ?, ?, ?, ?)"
+_SELECT_APPTS_SQL = "SELECT id, appt_date, appt_time, reason, created_at FROM appointments WHERE user_id = ? ORDER BY created_at DESC, id DESC"
+_INSERT_REVIEW_SQL = "INSERT INTO reviews (user_id, name, rating, comment) VALUES (?, ?, ?, ?)"
+_SELECT_REVIEWS_SIGNATURE_SQL = "SELECT COUNT(*), MAX(created_at) FROM reviews"
+_SELECT_REVIEWS_SQL = "SELECT id, user_id, name, rating, comment, created_at FROM reviews ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+# Filled with one "?" per id; see load_user_emails().
+_SELECT_USER_EMAILS_SQL = "SELECT id, email FROM users WHERE id IN ({})"
+_SELECT_SESSION_SQL = "SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?"
+_TOUCH_SESSION_SQL = "UPDATE sessions SET expires_at = ? WHERE id = ?"
+_UPSERT_SESSION_SQL = "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)"
+_DELETE_SESSION_SQL = "DELETE FROM sessions WHERE id = ?"
+_PURGE_SESSIONS_SQL = "DELETE FROM sessions WHERE expires_at <= ?"
+
+# --- Sessions ---
+# Logged-in sessions are kept in the sessions table and the cookie only
+# carries a random session id. Rows are written only when the session changes
+# and are never evicted early, so other traffic can't log real users out.
+# Anonymous sessions (just flash messages) stay in a signed cookie, as with
+# Flask's default interface, so unauthenticated requests never write rows.
+# An active user's row has its expiry pushed back at most once per
+# _SESSION_TOUCH_INTERVAL seconds, so use keeps them logged in.
+_SESSION_TOUCH_INTERVAL = 60 * 60 * 24
+
+class SqliteSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.modified = False
+        self.accessed = False
+
+    # Track reads like Flask's SecureCookieSession, for the Vary header.
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+class SqliteSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+    cookie_sessions = SecureCookieSessionInterface()
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        # Signed cookies always contain a "."; token_urlsafe() ids never do.
+        if value and "." in value:
+            signer = self.cookie_sessions.get_signing_serializer(app)
+            try:
+                data = signer.loads(value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+            except BadSignature:
+                data = None
+            if data is not None:
+                return SqliteSession(data, sid=secrets.token_urlsafe(32), new=True)
+        elif value:
+            row = get_db().execute(_SELECT_SESSION_SQL, (value, time.time())).fetchone()
+            if row is not None:
+                return SqliteSession(
+                    self.serializer.loads(row["data"]), sid=value, expires_at=row["expires_at"]
+                )
+        return SqliteSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def regenerate(self, session):
+        """Move session to a fresh id, e.g. on login, and drop the old row."""
+        if not session.new:
+            with _WRITE_LOCK:
+                get_db().execute(_DELETE_SESSION_SQL, (session.sid,))
+        session.sid = secrets.token_urlsafe(32)
+        session.new = True
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Pages that read the session differ per user; keep shared caches out.
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        # Only check out a connection on the branches that write, so requests
+        # that leave the session alone (static files, most GETs) never touch
+        # the pool.
+        if "user_id" not in session:
+            # A stored session that lost its user (logout) drops its row.
+            if not session.new:
+                with _WRITE_LOCK:
+                    get_db().execute(_DELETE_SESSION_SQL, (session.sid,))
+            if not session:
+                if session.modified:
+                    response.delete_cookie(name, domain=domain, path=path)
+                return
+            if session.modified:
+                signer = self.cookie_sessions.get_signing_serializer(app)
+                self._set_cookie(app, session, response, signer.dumps(dict(session)))
+            return
+
+        now = time.time()
+        expires_at = now + app.permanent_session_lifetime.total_seconds()
+        if not session.modified:
+            if session.expires_at is not None and expires_at - session.expires_at >= _SESSION_TOUCH_INTERVAL:
+                with _WRITE_LOCK:
+                    get_db().execute(_TOUCH_SESSION_SQL, (expires_at, session.sid))
+                if session.permanent:
+                    self._set_cookie(app, session, response, session.sid)
+            return
 
-# Initialize DB on import (safe small operation)
-init_db()
+        db = get_db()
+        with _WRITE_LOCK:
+            if session.new:
+                db.execute(_PURGE_SESSIONS_SQL, (now,))
+            db.execute(_UPSERT_SESSION_SQL, (session.sid, self.serializer.dumps(dict(session)), expires_at))
+        self._set_cookie(app, session, response, session.sid)
+
+    def _set_cookie(self, app, session, response, value):
+        response.set_cookie(
+            self.get_cookie_name(app),
+            value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=self.get_cookie_domain(app),
+            path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+app.session_interface = SqliteSessionInterface()
+
+# Lightweight row type for the reviews listing; attribute access in templates
+# avoids sqlite3.Row's per-column name lookup.
+Review = collections.namedtuple("Review", "id user_id name rating comment created_at user_email")
+
+# (signature, {page: html}) for the rendered review-list fragments, valid
+# while the reviews table's signature (row count + newest timestamp) is
+# unchanged. Always replaced as a whole tuple so request threads never pair
+# one signature with another signature's pages.
+_REVIEWS_CACHE = (None, {})
 
 # --- Auth helpers ---
+# Password hashing is the only CPU-heavy step; cap how many run at once so a
+# burst of registrations/logins can't starve every other request thread.
+_HASH_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+def hash_password(password):
+    method = app.config["PASSWORD_HASH_METHOD"]
+    if method:
+        return _HASH_POOL.submit(generate_password_hash, password, method=method).result()
+    return _HASH_POOL.submit(generate_password_hash, password).result()
+
+def verify_password(password_hash, password):
+    return _HASH_POOL.submit(check_password_hash, password_hash, password).result()
+
+# Emails that just failed to log in because no account has them, mapped to
+# an expiry time. Retries inside the window are rejected without a DB lookup,
+# which sheds load during credential-stuffing bursts. Emails with an account
+# are never cached, so a correct password is never refused.
+_REJECTED_LOGINS = collections.OrderedDict()
+_REJECTED_LOGINS_LOCK = threading.Lock()
+_REJECTED_LOGIN_TTL = 5
+_REJECTED_LOGINS_MAX = 1024
+
+def recently_rejected(email):
+    with _REJECTED_LOGINS_LOCK:
+        expires = _REJECTED_LOGINS.get(email)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del _REJECTED_LOGINS[email]
+            return False
+        return True
+
+def remember_rejected(email):
+    with _REJECTED_LOGINS_LOCK:
+        _REJECTED_LOGINS[email] = time.monotonic() + _REJECTED_LOGIN_TTL
+        _REJECTED_LOGINS.move_to_end(email)
+        while len(_REJECTED_LOGINS) > _REJECTED_LOGINS_MAX:
+            _REJECTED_LOGINS.popitem(last=False)
+
+def forget_rejected(email):
+    with _REJECTED_LOGINS_LOCK:
+        _REJECTED_LOGINS.pop(email, None)
+
+# Lookups are memoized on g, so repeated calls within a request hit the DB once.
 def get_user_by_email(email):
-    db = get_db()
-    cur = db.execute("SELECT * FROM users WHERE email = ?", (email,))
-    return cur.fetchone()
+    cache = g.setdefault("_user_email_cache", {})
+    if email not in cache:
+        db = get_db()
+        cur = db.execute(_SELECT_USER_BY_EMAIL_SQL, (email,))
+        cache[email] = cur.fetchone()
+    return cache[email]
 
 def get_user_by_id(user_id):
-    db = get_db()
-    cur = db.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    return cur.fetchone()
+    cache = g.setdefault("_user_cache", {})
+    if user_id not in cache:
+        db = get_db()
+        cur = db.execute(_SELECT_USER_BY_ID_SQL, (user_id,))
+        cache[user_id] = cur.fetchone()
+    return cache[user_id]
+
+def load_user_emails(user_ids):
+    """Map each user id to its email with one batched query."""
+    if not user_ids:
+        return {}
+    user_ids = tuple(user_ids)
+    sql = _SELECT_USER_EMAILS_SQL.format(",".join("?" * len(user_ids)))
+    return dict(get_db().execute(sql, user_ids).fetchall())
+
+def clear_user_cache():
+    g.pop("_user_cache", None)
+    g.pop("_user_email_cache", None)
 
 def login_required(f):
-    from functools import wraps
     @wraps(f)
     def wrapped(*args, **kwargs):
         if "user_id" not in session:
@@ -124,22 +498,26 @@ def book():
             return redirect(url_for("book"))
 
         db = get_db()
-        db.execute(
-            "INSERT INTO appointments (user_id, name, email, appt_date, appt_time, reason, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (session.get("user_id"), name, email, appt_date, appt_time, reason, datetime.utcnow().isoformat())
-        )
-        db.commit()
+        with _WRITE_LOCK:
+            db.execute(
+                _INSERT_APPT_SQL,
+                (session.get("user_id"), name, email, appt_date, appt_time, reason)
+            )
+            db.commit()
         flash("Appointment booked successfully.", "success")
         return redirect(url_for("book"))
 
     # Show user's appointments
     db = get_db()
-    cur = db.execute("SELECT * FROM appointments WHERE user_id = ? ORDER BY created_at DESC", (session.get("user_id"),))
-    appointments = cur.fetchall()
-    return render_template("book.html", appointments=appointments)
+    cur = db.execute(_SELECT_APPTS_SQL, (session.get("user_id"),))
+    # The session cookie is written before a streamed body, so pop pending
+    # flashes now; the template's get_flashed_messages() reuses them.
+    get_flashed_messages()
+    return Response(stream_template("book.html", appointments=iter_rows(cur)), mimetype="text/html")
 
 @app.route("/reviews", methods=["GET", "POST"])
 def reviews():
+    global _REVIEWS_CACHE
     db = get_db()
     if request.method == "POST":
         if "user_id" not in session:
@@ -153,17 +531,61 @@ def reviews():
             flash("Please provide your name and a rating.", "danger")
             return redirect(url_for("reviews"))
 
-        db.execute(
-            "INSERT INTO reviews (user_id, name, rating, comment, created_at) VALUES (?, ?, ?, ?, ?)",
-            (session.get("user_id"), name, int(rating), comment, datetime.utcnow().isoformat())
-        )
-        db.commit()
+        with _WRITE_LOCK:
+            db.execute(
+                _INSERT_REVIEW_SQL,
+                (session.get("user_id"), name, int(rating), comment)
+            )
+            db.commit()
+        _REVIEWS_CACHE = (None, {})
         flash("Thanks for your review!", "success")
         return redirect(url_for("reviews"))
 
-    cur = db.execute("SELECT r.*, u.email as user_email FROM reviews r LEFT JOIN users u ON r.user_id = u.id ORDER BY r.created_at DESC")
-    reviews = cur.fetchall()
-    return render_template("reviews.html", reviews=reviews)
+    page = max(request.args.get("page", 1, type=int), 1)
+    count, latest = db.execute(_SELECT_REVIEWS_SIGNATURE_SQL).fetchone()
+    # Past the last page; also keeps huge ?page= values out of the OFFSET bind.
+    if (page - 1) * REVIEWS_PER_PAGE >= max(count, 1):
+        abort(404)
+    signature = f"{count}:{latest}"
+
+    # The full page also shows the logged-in user, so they are part of the ETag.
+    # Pending flash messages must be rendered, so never answer 304 then.
+    etag = hashlib.sha1(
+        f"{signature}:{page}:{session.get('user_id')}".encode()
+    ).hexdigest()
+    if "_flashes" not in session and request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+
+    cached_signature, pages = _REVIEWS_CACHE
+    if cached_signature != signature:
+        pages = {}
+        _REVIEWS_CACHE = (signature, pages)
+    reviews_html = pages.get(page)
+    if reviews_html is None:
+        # Fetch one extra row to know whether there is a next page.
+        cur = db.execute(
+            _SELECT_REVIEWS_SQL,
+            (REVIEWS_PER_PAGE + 1, (page - 1) * REVIEWS_PER_PAGE)
+        )
+        rows = cur.fetchall()
+        # Reviews repeat a few authors, so fetch their emails once each
+        # instead of joining users onto every review row.
+        emails = load_user_emails({r["user_id"] for r in rows if r["user_id"] is not None})
+        reviews = [Review(*r, emails.get(r["user_id"])) for r in rows]
+        has_next = len(reviews) > REVIEWS_PER_PAGE
+        reviews_html = Markup(render_template(
+            "reviews_list.html", reviews=reviews[:REVIEWS_PER_PAGE], page=page, has_next=has_next
+        ))
+        # Out-of-range pages 404 above, so only real pages are stored here.
+        pages[page] = reviews_html
+
+    response = make_response(render_template("reviews.html", reviews_html=reviews_html))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 # --- Auth routes ---
 @app.route("/register", methods=["GET", "POST"])
@@ -184,13 +606,16 @@ def register():
             flash("An account with that email already exists.", "warning")
             return redirect(url_for("register"))
 
-        password_hash = generate_password_hash(password)
+        password_hash = hash_password(password)
         db = get_db()
-        db.execute(
-            "INSERT INTO users (name, email, password_hash, created_at) VALUES (?, ?, ?, ?)",
-            (name, email, password_hash, datetime.utcnow().isoformat())
-        )
-        db.commit()
+        with _WRITE_LOCK:
+            db.execute(
+                _INSERT_USER_SQL,
+                (name, email, password_hash)
+            )
+            db.commit()
+        clear_user_cache()
+        forget_rejected(email)
         flash("Registration successful. Please log in.", "success")
         return redirect(url_for("login"))
 
@@ -205,13 +630,20 @@ def login():
         email = request.form.get("email", "").strip().lower()
         password = request.form.get("password", "")
 
+        if recently_rejected(email):
+            flash("Invalid email or password.", "danger")
+            return redirect(url_for("login"))
+
         user = get_user_by_email(email)
-        if not user or not check_password_hash(user["password_hash"], password):
+        if user is None:
+            remember_rejected(email)
+        if not user or not verify_password(user["password_hash"], password):
             flash("Invalid email or password.", "danger")
             return redirect(url_for("login"))
 
+        clear_user_cache()
+        app.session_interface.regenerate(session)
         session["user_id"] = user["id"]
-        session["user_name"] = user["name"]
         flash(f"Welcome back, {user['name']}!", "success")
         return redirect(url_for("home"))
 
@@ -220,6 +652,7 @@ def login():
 @app.route("/logout")
 def logout():
     session.clear()
+    clear_user_cache()
     flash("You have been logged out.", "info")
     return redirect(url_for("home"))
 